@@ -3,59 +3,108 @@ import dotenv
 dotenv.load_dotenv()
 
 import argparse
-import toml
+
+try:
+    import tomllib
+except ModuleNotFoundError:
+    import tomli as tomllib
 import resource
 import docker
 from pathlib import Path
-import json
+import itertools
+import orjson
 import os
 import shutil
+import threading
 import logging
+from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from typing import Optional
 from swebench.harness.run_evaluation import run_instances
 from swebench.harness.docker_utils import list_images, clean_images
 from swebench.harness.docker_build import build_env_images
+from swebench.harness.test_spec import make_test_spec
 from langsmith.evaluation import evaluate_existing
 from langsmith.schemas import Example, Run
 from langsmith.evaluation import evaluate
 from langsmith import Client
 from cura.prediction import do_prediction_plan
-from cura.utils import timeout as timeout_decorator
+from cura.utils import RateLimiter
+from cura.cache import PredictionCache
 
 
 def main(config):
     logger = logging.getLogger("Evaluation")
     client = Client()
+    evaluation_config = config.get("evaluation", {})
+    rate_limiter = RateLimiter(
+        requests_per_minute=evaluation_config.get("requests_per_minute", 500),
+        tokens_per_minute=evaluation_config.get("tokens_per_minute", 200_000),
+    )
+    model_name = "gpt-4o-mini"
+    cache = PredictionCache(
+        policy=config["prediction"].get("cache_policy", "disabled"),
+        logger=logger.getChild("cache"),
+    )
+    example_counter = itertools.count(1)
 
     def predict(inputs: dict):
-        version = inputs.get("version", "")
-        if isinstance(version, float):
-            version = str(version)
-        elif not isinstance(version, str):
-            logger.warning(f"Unexpected type for version: {type(version)}")
-            version = str(version)
-
-        if ":" in version:
-            inputs["version"] = version.split(":")[1]
+        logger.info(
+            f"Predicting example {next(example_counter)}: {inputs['instance_id']}"
+        )
+        version = inputs.get("version")
+        if isinstance(version, str) and ":" in version:
+            inputs["version"] = version.split(":", 1)[1]
         else:
-            logger.warning(f"Version string does not contain ':': {version}")
-            inputs["version"] = version
+            logger.debug(f"Version has no prefix to strip: {version!r}")
+            inputs["version"] = str(version) if version is not None else ""
+
+        cache_key = PredictionCache.compute_key(inputs, model_name)
+        cached_patch = cache.lookup(cache_key)
+        if cached_patch is not None:
+            return {
+                "instance_id": inputs["instance_id"],
+                "model_patch": cached_patch,
+                "model_name_or_path": model_name,
+            }
 
-        def get_patch_with_timeout(inputs: dict):
+        def get_patch(inputs: dict):
             patch = do_prediction_plan(inputs, config["prediction"])
             return patch
 
+        # Acquire budget before starting the timed call so time spent queuing
+        # for rate limit does not count against the prediction timeout.
+        rate_limiter.acquire(
+            estimated_tokens=len(inputs.get("problem_statement", "")) // 4 + 1_000
+        )
+        # Each prediction gets its own single-worker executor: the shared pool
+        # in cura.utils also serves the nested tool and install timeouts that
+        # run inside every prediction, so submitting the outer task there can
+        # fill the pool and deadlock against them.
+        prediction_executor = ThreadPoolExecutor(max_workers=1)
         try:
-            patch = get_patch_with_timeout(inputs)
+            patch = prediction_executor.submit(get_patch, inputs).result(timeout=500)
+            # Leave empty patches uncached, like timeouts and exceptions, so a
+            # transient bad run is retried on the next evaluation.
+            if patch:
+                cache.store(cache_key, patch, model_name)
+        except FuturesTimeoutError:
+            logger.warning(
+                f"Prediction for {inputs['instance_id']} timed out after 500 seconds"
+            )
+            patch = ""
         except Exception as e:
             logger.warning(
                 f"Failed to get patch for {inputs['instance_id']} because of {e}"
             )
             patch = ""
+        finally:
+            prediction_executor.shutdown(wait=False)
         return {
             "instance_id": inputs["instance_id"],
             "model_patch": patch,
-            "model_name_or_path": "gpt-4o-mini",
+            "model_name_or_path": model_name,
         }
 
     if config["dataset"]["experiment_name"] == "None":
@@ -67,75 +116,94 @@ def main(config):
         eval_result = evaluate(
             predict,
             data=client.list_examples(dataset_id=config["dataset"]["id"], limit=limit),
-            max_concurrency=1,
+            max_concurrency=evaluation_config.get("max_concurrency", 16),
             experiment_prefix="CURA",
         )
         experiment_name = eval_result.experiment_name
     else:
         eval_result = evaluate_existing(config["dataset"]["experiment_name"])
         experiment_name = eval_result.experiment_name
-        eval_result = [res for res in eval_result if res["run"].outputs is not None]
 
-    predictions = {
-        res["run"].outputs["instance_id"]: {
-            **res["run"].outputs,
+    # Single pass: eval_result may be a generator, so building predictions and
+    # instances in separate comprehensions would leave the second one empty.
+    predictions = {}
+    instances = []
+    for res in eval_result:
+        outputs = res["run"].outputs
+        if outputs is None:
+            continue
+        predictions[outputs["instance_id"]] = {
+            **outputs,
             "run_id": str(res["run"].id),
         }
-        for res in eval_result
-    }
-    instances = [res["run"].inputs["inputs"] for res in eval_result]
-    for instance in instances:
+        instance = res["run"].inputs["inputs"]
         if "version:" in instance["version"]:
-            instance["version"] = instance["version"].split(":")[1]
+            instance["version"] = instance["version"].split(":", 1)[1]
+        instances.append(instance)
 
     RUN_EVALUATION_LOG_DIR = Path("logs/run_evaluation")
     LANGSMITH_EVALUATION_DIR = "./langsmith_feedback/feedback.json"
     RUN_EVALUATION_DIR = "./logs/run_evaluation"
 
-    if os.path.exists(RUN_EVALUATION_DIR):
-        shutil.rmtree(RUN_EVALUATION_DIR)
+    # Rename is O(1); deleting thousands of log files proceeds in the
+    # background while the evaluation runs.
+    trash_path = f"{RUN_EVALUATION_DIR}.trash-{uuid4()}"
+    try:
+        os.rename(RUN_EVALUATION_DIR, trash_path)
+    except FileNotFoundError:
+        pass
+    else:
+        threading.Thread(
+            target=shutil.rmtree,
+            args=(trash_path,),
+            kwargs={"ignore_errors": True},
+            daemon=True,
+        ).start()
 
     def convert_runs_to_langsmith_feedback(
         predictions: dict, full_dataset: list, run_id: str
     ) -> float:
-        feedback_for_all_instances = {}
-
-        for instance in full_dataset:
-            feedback_for_instance = []
-            instance_id = instance["instance_id"]
-            prediction = predictions[instance_id]
-            if prediction.get("model_patch", None) in ["", None]:
-                feedback_for_all_instances[prediction["run_id"]] = [
-                    {"key": "non-empty-patch", "score": 0},
-                    {"key": "completed-patch", "score": 0},
-                    {"key": "resolved-patch", "score": 0},
-                ]
-                continue
-            feedback_for_instance.append({"key": "non-empty-patch", "score": 1})
-            report_file = (
-                RUN_EVALUATION_LOG_DIR
-                / run_id
-                / prediction["model_name_or_path"].replace("/", "__")
-                / prediction["instance_id"]
-                / "report.json"
-            )
-            if report_file.exists():
-                feedback_for_instance.append({"key": "completed-patch", "score": 1})
-                report = json.loads(report_file.read_text())
-                if report[instance_id]["resolved"]:
-                    feedback_for_instance.append({"key": "resolved-patch", "score": 1})
-                else:
-                    feedback_for_instance.append({"key": "resolved-patch", "score": 0})
-            else:
-                feedback_for_instance += [
-                    {"key": "completed-patch", "score": 0},
-                    {"key": "resolved-patch", "score": 0},
-                ]
-            feedback_for_all_instances[prediction["run_id"]] = feedback_for_instance
+        run_prefix = os.path.join(str(RUN_EVALUATION_LOG_DIR), run_id)
+        model_dirs = {}
 
         os.makedirs(os.path.dirname(LANGSMITH_EVALUATION_DIR), exist_ok=True)
-        with open(LANGSMITH_EVALUATION_DIR, "w") as json_file:
-            json.dump(feedback_for_all_instances, json_file)
+        # Write one JSON object entry per instance instead of holding the
+        # whole feedback dict in memory before a single dump.
+        with open(LANGSMITH_EVALUATION_DIR, "wb") as json_file:
+            json_file.write(b"{")
+            separator = b""
+            for instance in full_dataset:
+                instance_id = instance["instance_id"]
+                prediction = predictions[instance_id]
+                non_empty = int(bool(prediction.get("model_patch")))
+                completed = 0
+                resolved = 0
+                if non_empty:
+                    model = prediction["model_name_or_path"]
+                    model_dir = model_dirs.get(model)
+                    if model_dir is None:
+                        model_dir = os.path.join(run_prefix, model.replace("/", "__"))
+                        model_dirs[model] = model_dir
+                    report_path = os.path.join(model_dir, instance_id, "report.json")
+                    try:
+                        with open(report_path, "rb") as report_file:
+                            report = orjson.loads(report_file.read())
+                    except FileNotFoundError:
+                        pass
+                    else:
+                        completed = 1
+                        resolved = int(bool(report[instance_id]["resolved"]))
+                feedback_for_instance = [
+                    {"key": "non-empty-patch", "score": non_empty},
+                    {"key": "completed-patch", "score": completed},
+                    {"key": "resolved-patch", "score": resolved},
+                ]
+                json_file.write(separator)
+                json_file.write(orjson.dumps(prediction["run_id"]))
+                json_file.write(b":")
+                json_file.write(orjson.dumps(feedback_for_instance))
+                separator = b","
+            json_file.write(b"}")
 
     def evaluate_predictions(
         dataset: list,
@@ -147,6 +215,7 @@ def main(config):
         open_file_limit: int,
         run_id: str,
         timeout: int,
+        skip_build_if_present: bool = True,
     ):
         if not dataset:
             raise ValueError(
@@ -154,13 +223,42 @@ def main(config):
             )
 
         assert len(run_id) > 0, "Run ID must be provided"
-        resource.setrlimit(resource.RLIMIT_NOFILE, (open_file_limit, open_file_limit))
-        client = docker.from_env()
+        _, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard_limit != resource.RLIM_INFINITY and hard_limit < open_file_limit:
+            logger.warning(
+                f"Hard RLIMIT_NOFILE {hard_limit} is below the requested minimum "
+                f"{open_file_limit}; raise it in /etc/security/limits.conf if the "
+                "run exhausts file descriptors"
+            )
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard_limit, hard_limit))
+        # The larger pool keeps concurrent per-instance Docker API calls from
+        # serializing on one socket.
+        client = docker.from_env(max_pool_size=max(32, max_workers * 4))
 
         existing_images = list_images(client)
         print(f"Running {len(dataset)} unevaluated instances...")
 
-        build_env_images(client, dataset, force_rebuild, max_workers)
+        # Instances sharing (repo, version) use the same environment image, so
+        # one representative per environment is enough for the build step.
+        seen_environments = set()
+        env_dataset = []
+        for instance in dataset:
+            environment = (instance["repo"], instance["version"])
+            if environment not in seen_environments:
+                seen_environments.add(environment)
+                env_dataset.append(instance)
+
+        expected_env_images = {
+            make_test_spec(instance).env_image_key for instance in env_dataset
+        }
+        if (
+            skip_build_if_present
+            and not force_rebuild
+            and expected_env_images.issubset(existing_images)
+        ):
+            print("All environment images already exist, skipping build.")
+        else:
+            build_env_images(client, env_dataset, force_rebuild, max_workers)
         run_instances(
             predictions,
             dataset,
@@ -179,22 +277,22 @@ def main(config):
     evaluate_predictions(
         instances,
         predictions,
-        max_workers=8,
+        max_workers=evaluation_config.get("max_workers")
+        or max(8, min(os.cpu_count() or 8, len(instances))),
         force_rebuild=False,
         cache_level="env",
         clean=False,
-        open_file_limit=4096,
+        open_file_limit=evaluation_config.get("open_file_limit", 100_000),
         run_id="test",
         timeout=1_800,
+        skip_build_if_present=evaluation_config.get("skip_build_if_present", True),
     )
 
+    with open(LANGSMITH_EVALUATION_DIR, "rb") as json_file:
+        langsmith_eval = orjson.loads(json_file.read())
+
     def swe_bench_evaluator(run: Run, example: Example):
-        with open(LANGSMITH_EVALUATION_DIR, "r") as json_file:
-            langsmith_eval = json.load(json_file)
-        if str(run.id) in langsmith_eval:
-            return {"results": langsmith_eval[str(run.id)]}
-        else:
-            return {"results": []}
+        return {"results": langsmith_eval.get(str(run.id), [])}
 
     evaluate_existing(experiment_name, evaluators=[swe_bench_evaluator])
 
@@ -203,5 +301,6 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", type=str, default="configs/default_config.toml")
     args = parser.parse_args()
-    config = toml.load(args.config)
+    with open(args.config, "rb") as config_file:
+        config = tomllib.load(config_file)
     main(config)
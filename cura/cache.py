@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import logging
+from typing import Optional
+
+CACHE_POLICIES = {"enabled", "read-only", "write-only", "replay", "disabled"}
+
+class CacheMissError(Exception):
+    """Raised when the cache policy is 'replay' and a key is not in the cache."""
+
+class PredictionCache:
+    """An on-disk cache for prediction patches keyed by a SHA256 hash of the prediction inputs. Backed by SQLite so repeated evaluation runs can reuse patches instead of re-issuing LLM calls. Safe to share between threads.
+
+    Args:
+        cache_dir (str, optional): Directory to store the cache database in. Defaults to "cache/predictions".
+        policy (str, optional): One of "enabled" (read and write), "read-only", "write-only", "replay" (read, raise CacheMissError on miss) or "disabled". Defaults to "enabled".
+    """
+
+    def __init__(self, cache_dir: str = "cache/predictions", policy: str = "enabled", logger: Optional[logging.Logger] = None):
+        if policy not in CACHE_POLICIES:
+            raise ValueError(f"Unknown cache policy: {policy}. Must be one of {sorted(CACHE_POLICIES)}.")
+        self.policy = policy
+        self.logger = logger if logger is not None else logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._connection = None
+        if policy != "disabled":
+            os.makedirs(cache_dir, exist_ok=True)
+            self._connection = sqlite3.connect(os.path.join(cache_dir, "predictions.db"), check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, patch TEXT, model TEXT)"
+            )
+            self._connection.commit()
+
+    @staticmethod
+    def compute_key(inputs: dict, model_name: str, provider: str = "openai", temperature: float = 0) -> str:
+        """Computes a deterministic cache key from the prediction inputs and model settings.
+
+        Args:
+            inputs (dict): The prediction inputs (instance_id, repo, problem_statement, ...).
+            model_name (str): The model used for the prediction.
+            provider (str, optional): The model provider. Defaults to "openai".
+            temperature (float, optional): The sampling temperature. Defaults to 0.
+
+        Returns:
+            str: The SHA256 hex digest of the inputs and model settings.
+        """
+        payload = json.dumps(inputs, sort_keys=True, default=str) + model_name + provider + str(temperature)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Looks up a patch by key. Returns None on miss, or raises CacheMissError when the policy is "replay".
+
+        Args:
+            key (str): The cache key from compute_key.
+
+        Returns:
+            Optional[str]: The cached patch, or None if the key is not cached or the policy does not allow reads.
+        """
+        if self.policy in {"disabled", "write-only"}:
+            return None
+        with self._lock:
+            row = self._connection.execute("SELECT patch FROM predictions WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self.logger.info(f"Cache hit for key {key}.")
+            return row[0]
+        if self.policy == "replay":
+            raise CacheMissError(f"Cache miss for key {key} with policy 'replay'.")
+        return None
+
+    def store(self, key: str, patch: str, model_name: str):
+        """Stores a patch under the given key. No-op when the policy does not allow writes.
+
+        Args:
+            key (str): The cache key from compute_key.
+            patch (str): The patch to cache.
+            model_name (str): The model that produced the patch.
+        """
+        if self.policy in {"disabled", "read-only", "replay"}:
+            return
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO predictions (key, patch, model) VALUES (?, ?, ?)",
+                (key, patch, model_name),
+            )
+            self._connection.commit()
@@ -0,0 +1,53 @@
+from cura.cache import PredictionCache, CacheMissError
+import tempfile
+
+TEST_INPUTS = {
+    "instance_id": "test__repo-1",
+    "repo": "test/repo",
+    "version": "1.0",
+    "problem_statement": "Fix the bug.",
+}
+
+def test_cache_roundtrip():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = PredictionCache(cache_dir=cache_dir, policy="enabled")
+        key = PredictionCache.compute_key(TEST_INPUTS, "gpt-4o-mini")
+        assert key == PredictionCache.compute_key(dict(TEST_INPUTS), "gpt-4o-mini")
+        assert key != PredictionCache.compute_key(TEST_INPUTS, "gpt-4o")
+
+        assert cache.lookup(key) is None
+        cache.store(key, "diff --git a/a.py b/a.py", "gpt-4o-mini")
+        assert cache.lookup(key) == "diff --git a/a.py b/a.py"
+
+def test_cache_policies():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        key = PredictionCache.compute_key(TEST_INPUTS, "gpt-4o-mini")
+
+        cache = PredictionCache(cache_dir=cache_dir, policy="write-only")
+        cache.store(key, "patch", "gpt-4o-mini")
+        assert cache.lookup(key) is None
+
+        cache = PredictionCache(cache_dir=cache_dir, policy="read-only")
+        assert cache.lookup(key) == "patch"
+        cache.store(key, "other patch", "gpt-4o-mini")
+        assert cache.lookup(key) == "patch"
+
+        cache = PredictionCache(cache_dir=cache_dir, policy="replay")
+        assert cache.lookup(key) == "patch"
+        missing_key = PredictionCache.compute_key(TEST_INPUTS, "other-model")
+        try:
+            cache.lookup(missing_key)
+        except CacheMissError:
+            pass
+        else:
+            assert False, "Should have raised a CacheMissError"
+
+        cache = PredictionCache(cache_dir=cache_dir, policy="disabled")
+        assert cache.lookup(key) is None
+
+    try:
+        PredictionCache(policy="unknown")
+    except ValueError:
+        pass
+    else:
+        assert False, "Should have raised a ValueError"
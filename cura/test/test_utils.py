@@ -1,4 +1,4 @@
-from cura.utils import timeout
+from cura.utils import timeout, RateLimiter
 import time
 from concurrent.futures import TimeoutError
 
@@ -23,4 +23,19 @@ def test_timeout():
     except TimeoutError:
         assert False, "Should not have raised a TimeoutError"
     else:
-        pass
\ No newline at end of file
+        pass
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(requests_per_minute=6000, tokens_per_minute=600000)
+    start = time.perf_counter()
+    for _ in range(5):
+        limiter.acquire(100)
+    assert time.perf_counter() - start < 0.5, "Should not block when budget is available"
+
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=600000)
+    limiter._request_tokens = 0
+    start = time.perf_counter()
+    limiter.acquire(1)
+    elapsed = time.perf_counter() - start
+    assert elapsed >= 0.5, "Should block until the request budget refills"
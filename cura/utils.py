@@ -1,5 +1,6 @@
 from functools import wraps
 import time
+import threading
 from concurrent.futures import ThreadPoolExecutor
 
 executor = ThreadPoolExecutor()
@@ -18,6 +19,47 @@ def timeout(seconds: float):
         return wrapper
     return decorator
 
+class RateLimiter:
+    """Token bucket rate limiter for provider request/token budgets. Refills both buckets continuously based on the elapsed time and blocks callers until enough budget is available. Safe to share between threads.
+
+    Args:
+        requests_per_minute (float): Maximum number of requests per minute.
+        tokens_per_minute (float): Maximum number of tokens per minute.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self._requests_per_minute = requests_per_minute
+        self._tokens_per_minute = tokens_per_minute
+        self._request_tokens = requests_per_minute
+        self._token_tokens = tokens_per_minute
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_tokens = min(
+            self._requests_per_minute,
+            self._request_tokens + elapsed * self._requests_per_minute / 60,
+        )
+        self._token_tokens = min(
+            self._tokens_per_minute,
+            self._token_tokens + elapsed * self._tokens_per_minute / 60,
+        )
+
+    def acquire(self, estimated_tokens: int = 0):
+        """Blocks until one request and the estimated number of tokens are available, then consumes them. Estimates above the per-minute capacity are clamped to it, since the bucket can never hold more than that."""
+        estimated_tokens = min(estimated_tokens, self._tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._request_tokens >= 1 and self._token_tokens >= estimated_tokens:
+                    self._request_tokens -= 1
+                    self._token_tokens -= estimated_tokens
+                    return
+            time.sleep(0.1)
+
 class TimeRecorder:
     def __init__(self, title: str = "Task"):
         self.t = 0
@@ -1,4 +1,5 @@
 import docker
+import functools
 import tarfile
 import os
 from cura.interface import Interface, port
@@ -17,6 +18,31 @@ from swebench.harness.utils import get_environment_yml, get_requirements
 from typing import TypedDict
 from cura.utils import timeout
 
+@functools.lru_cache(maxsize=None)
+def ensure_swe_image(arch: str) -> str:
+    """Returns the swe image tag for the given architecture, building the image if it does not exist. All instances on the same architecture share the image, so the Docker round-trip is memoized per process.
+
+    Args:
+        arch (str): The target architecture, "arm64" or "x86_64".
+
+    Returns:
+        str: The image tag.
+    """
+    logger = logging.getLogger(ensure_swe_image.__name__)
+    image_name = f"swe:{arch}"
+    client = docker.from_env()
+    if image_name not in [tag for image in client.images.list() for tag in image.tags]:
+        logger.info(f"Image {image_name} not found, building image.")
+        client.images.build(
+            path=".",
+            dockerfile="docker/swe.Dockerfile",
+            buildargs={"TARGETARCH": arch},
+            tag=image_name
+        )
+    else:
+        logger.info(f"Image {image_name} found.")
+    return image_name
+
 class VirtualMachine:
     """
     A Basic Virtual Machine class that can run commands and copy files to and from the VM.
@@ -207,26 +233,14 @@ class SWEVM(VM_with_interface):
         logger.info(f"Copied repo {repo_name} with commit {commit_hash} to {self.repo_path}.")
         
     def _get_image_name(self):
-        
+
         if platform.machine() in {"aarch64", "arm64"}:
             arch = "arm64" if self.data["instance_id"] not in USE_X86 else "x86_64"
         else:
             arch = "x86_64"
-        image_name = f"swe:{arch}"
-        self.logger.info(f"Getting image name {image_name}.")
-        client = docker.from_env()
-        if image_name not in [tag for image in client.images.list() for tag in image.tags]:
-            self.logger.info(f"Image {image_name} not found, building image.")
-            client.images.build(
-                path=".",
-                dockerfile="docker/swe.Dockerfile",
-                buildargs={"TARGETARCH": arch},
-                tag=image_name
-            )
-        else:
-            self.logger.info(f"Image {image_name} found.")
-        return image_name
-            
+        self.logger.info(f"Getting image name swe:{arch}.")
+        return ensure_swe_image(arch)
+
     @timeout(300)
     def _install_env(self):
         logger = self.logger.getChild("install_env")
@@ -26,7 +26,8 @@ setup(
         'langchain-huggingface',
         'langchain-text-splitters',
         'langchain-chroma',
-        'pysqlite3-binary'
+        'pysqlite3-binary',
+        'orjson'
     ],
     entry_points={
         'console_scripts': [